@@ -1,12 +1,7 @@
-from utilities import getUserProperty, kingOfTheStreet, collectionsDict
+from utilities import trimDecisionVariables
 import pandas as pd
-from os import path
-import numpy as np
 import itertools 
-import requests
-import timeit 
 import pulp
-import sys
 
 
 def cityProConstraint(prob, dvData, modelVars):
@@ -95,9 +90,11 @@ def kingOfStreetConstraint(prob, dvData, modelVars):
     return prob  
         
 
-def optimizeCollection(dvData, allCollections, collectionIDs=None):
+def buildModel(dvData, allCollections):
     '''
-    Interger linear programming over the decsion variables
+    Builds the collection ILP without solving it. The returned model can
+    be modified with setObjective, limitMoves, requireCollections and 
+    applyMask and re-solved without rebuilding.
     
     Parameters
     ----------
@@ -105,14 +102,13 @@ def optimizeCollection(dvData, allCollections, collectionIDs=None):
         DataFrame of decsion variables
     allCollections: DataFrame
         All COllections
-    collectionIDs: list 
-        If specified subset of collection IDs to consider
-    
     
     Returns
     -------
     prob: PuLP Object
-        LP solution
+        ILP problem definition
+    modelVars: Dict
+        Dictionary of PuLP model decision variables keyed by dvData index
     '''
     # Create the 'prob' variable to contain the problem data
     prob = pulp.LpProblem("Collections", pulp.LpMaximize)
@@ -147,14 +143,40 @@ def optimizeCollection(dvData, allCollections, collectionIDs=None):
         propsInCollection = dvData[dvData['collectionID']==collectionID].index.to_list()
         prob += (pulp.lpSum( [modelVars[dv] for dv in propsInCollection ])) <= NNeeded , f'{NNeeded} Properties In {collectionName}' 
     
-    #import ipdb;ipdb.set_trace() 
     if any(dvData.collectionID.isin([21])):
         prob = cityProConstraint(prob, dvData, modelVars)
     if any(dvData.collectionID.isin([1])):        
         prob = kingOfStreetConstraint(prob, dvData, modelVars)
-    #import ipdb; ipdb.set_trace()
+    return prob, modelVars
+
+
+def optimizeCollection(dvData, allCollections, collectionIDs=None, 
+                       lpFile="Collections.lp"):
+    '''
+    Interger linear programming over the decsion variables
+    
+    Parameters
+    ----------
+    dvData: DataFrame
+        DataFrame of decsion variables
+    allCollections: DataFrame
+        All COllections
+    collectionIDs: list 
+        If specified subset of collection IDs to consider
+    lpFile: str
+        optional, default 'Collections.lp'. File the problem is written 
+        to, None to skip
+    
+    Returns
+    -------
+    prob: PuLP Object
+        LP solution
+    '''
+    prob, modelVars = buildModel(dvData, allCollections)
+
     # The problem data is written to an .lp file
-    prob.writeLP("Collections.lp")
+    if lpFile:
+        prob.writeLP(lpFile)
 
     # The problem is solved using PuLP's choice of Solver
     print('Solving')
@@ -164,6 +186,276 @@ def optimizeCollection(dvData, allCollections, collectionIDs=None):
     print(f'Status: {pulp.LpStatus[prob.status]}')
 
     return prob    
-                      
-#import ipdb; ipdb.set_trace()
 
+
+def _replaceConstraint(prob, name, constraint):
+    '''
+    Adds constraint under name, replacing any constraint of that name
+    '''
+    if name in prob.constraints:
+        del prob.constraints[name]
+    if constraint is not None:
+        prob += constraint, name
+    return prob
+
+
+def _movesExpression(dvData, modelVars, current):
+    '''
+    Number of properties whose assignment differs from current, as a 
+    linear expression. A currently assigned property moves unless its 
+    current decision variable is selected; an unassigned property moves
+    if any of its decision variables is selected. Properties without 
+    decision variables belong to another model and are not counted.
+    
+    Parameters
+    ----------
+    dvData: DataFrame
+        decsion variables
+    modelVars: Dict
+        Dictionary of PuLP model decision variables
+    current: dict
+        current assignment, propertyID -> collectionID
+    
+    Returns
+    -------
+    moves: LpAffineExpression
+        number of moved properties
+    '''
+    if current is None:
+        raise ValueError('current assignment is required to count moves')
+    modelProps = set(dvData.propertyID.astype(int))
+    current = {int(propID): int(collectionID) 
+               for propID, collectionID in current.items()
+               if int(propID) in modelProps}
+    terms = []
+    NCurrent = len(current)
+    for dv, data in dvData.iterrows():
+        propID = int(data.propertyID)
+        if propID not in current:
+            terms.append(modelVars[dv])
+        elif current[propID] == int(data.collectionID):
+            terms.append(-1 * modelVars[dv])
+    return pulp.lpSum(terms) + NCurrent
+
+
+def setObjective(prob, dvData, modelVars, current=None, movePenalty=0):
+    '''
+    Replaces the objective with the boosted yield less a penalty per 
+    property moved away from the current assignment
+    
+    Parameters
+    ----------
+    prob: Pulp Object
+        the ILP problem definition 
+    dvData: DataFrame
+        decsion variables
+    modelVars: Dict
+        Dictionary of PuLP model decision variables
+    current: dict
+        optional, current assignment propertyID -> collectionID. 
+        Required when movePenalty is not 0
+    movePenalty: float
+        optional, default 0. Yield per hour given up per moved property
+    
+    Returns
+    -------
+    prob: PuLP Object
+        problem with the new objective
+    '''
+    objective = pulp.lpSum([data.collectionBoost * data.yield_per_hour * modelVars[dv] 
+                            for dv,data in dvData.iterrows()])
+    if movePenalty:
+        objective -= movePenalty * _movesExpression(dvData, modelVars, current)
+    prob.setObjective(objective)
+    return prob
+
+
+def limitMoves(prob, dvData, modelVars, current, maxMoves):
+    '''
+    Caps the number of properties moved from the current assignment
+    
+    Parameters
+    ----------
+    prob: Pulp Object
+        the ILP problem definition 
+    dvData: DataFrame
+        decsion variables
+    modelVars: Dict
+        Dictionary of PuLP model decision variables
+    current: dict
+        current assignment, propertyID -> collectionID
+    maxMoves: int
+        maximum number of moved properties. None removes the cap
+    
+    Returns
+    -------
+    prob: PuLP Object
+        problem with the move constraint replaced
+    '''
+    constraint = None
+    if maxMoves is not None:
+        constraint = _movesExpression(dvData, modelVars, current) <= maxMoves
+    return _replaceConstraint(prob, 'MaxMoves', constraint)
+
+
+def requireCollections(prob, dvData, modelVars, allCollections, collectionIDs):
+    '''
+    Requires every listed collection to be complete. Replaces the 
+    collections required by a previous call.
+    
+    Parameters
+    ----------
+    prob: Pulp Object
+        the ILP problem definition 
+    dvData: DataFrame
+        decsion variables
+    modelVars: Dict
+        Dictionary of PuLP model decision variables
+    allCollections: DataFrame
+        All Collections
+    collectionIDs: list
+        collection IDs that must be completed, empty to require none
+    
+    Returns
+    -------
+    prob: PuLP Object
+        problem with the required collection constraints
+    '''
+    for name in [name for name in prob.constraints if name.startswith('Require')]:
+        del prob.constraints[name]
+    for collectionID in collectionIDs:
+        NNeeded = allCollections[allCollections.id == collectionID].amount.values[0]
+        propsInCollection = dvData[dvData['collectionID']==collectionID].index.to_list()
+        prob += (pulp.lpSum([modelVars[dv] for dv in propsInCollection])
+                 ) == NNeeded, f'Require{collectionID}'
+    return prob
+
+
+def keepMask(dvData, NKeep=None, NMaxStreets=None):
+    '''
+    Decision variables kept by collectionsDict(NKeep) and 
+    kingOfTheStreet(NMaxStreets), computed from dvData built with larger
+    limits so a sweep can reuse one model
+    
+    Parameters
+    ----------
+    dvData: DataFrame
+        decsion variables built with NKeep and NMaxStreets at least as 
+        large as requested here
+    NKeep: int
+        optional. Newbie, SFian and City Pro limit, see collectionsDict
+    NMaxStreets: int
+        optional. King of the Street streets per city, see 
+        kingOfTheStreet
+    
+    Returns
+    -------
+    mask: Series
+        True for decision variables to keep
+    '''
+    keep = trimDecisionVariables(dvData, NKeep=NKeep, NMaxStreets=NMaxStreets)
+    return pd.Series(dvData.index.isin(keep), index=dvData.index)
+
+
+def applyMask(modelVars, mask):
+    '''
+    Fixes masked out decision variables to 0 and frees the rest
+    
+    Parameters
+    ----------
+    modelVars: Dict
+        Dictionary of PuLP model decision variables
+    mask: Series
+        True for decision variables to keep
+    
+    Returns
+    -------
+    None
+    '''
+    for dv, keep in mask.items():
+        modelVars[dv].upBound = 1 if keep else 0
+
+
+def solveModel(prob, dvData, modelVars, msg=False):
+    '''
+    Solves a built model and collects the selected properties
+    
+    Parameters
+    ----------
+    prob: Pulp Object
+        the ILP problem definition 
+    dvData: DataFrame
+        decsion variables
+    modelVars: Dict
+        Dictionary of PuLP model decision variables
+    msg: bool
+        optional, default False. Show solver output
+    
+    Returns
+    -------
+    result: dict
+        'status', 'objective' and 'solution', collectionID -> list of 
+        propertyIDs. The solution is empty unless the status is Optimal
+    '''
+    prob.solve(pulp.PULP_CBC_CMD(msg=msg))
+    status = pulp.LpStatus[prob.status]
+    solution = {}
+    if status != 'Optimal':
+        return {'status': status, 'objective': None, 'solution': solution}
+    for dv, var in modelVars.items():
+        if var.value() is not None and var.value() > 0.5:
+            data = dvData.loc[dv]
+            solution.setdefault(int(data.collectionID), []).append(
+                                str(int(data.propertyID)))
+    return {'status': status,
+            'objective': pulp.value(prob.objective),
+            'solution': solution,
+           }
+
+
+def _solvePoint(modelDict, varNames, dvData, point):
+    '''
+    Solves one sweep point on an independent copy of the model
+    '''
+    variables, prob = pulp.LpProblem.from_dict(modelDict)
+    modelVars = {dv: variables[name] for dv, name in varNames.items()}
+    applyMask(modelVars, keepMask(dvData, **point))
+    result = solveModel(prob, dvData, modelVars)
+    result.update(point)
+    return result
+
+
+def sweep(prob, dvData, modelVars, points, workers=None):
+    '''
+    Solves the model once per parameter point. Each point gets its own
+    copy of the built model with the decision variables dropped by that
+    point fixed to 0; points are solved in parallel. The solver runs as
+    a separate process so threads are enough.
+    
+    Parameters
+    ----------
+    prob: Pulp Object
+        the ILP problem definition 
+    dvData: DataFrame
+        decsion variables built with the largest NKeep and NMaxStreets
+    modelVars: Dict
+        Dictionary of PuLP model decision variables
+    points: list
+        dictionaries of keepMask arguments, e.g. 
+        [{'NKeep': 10, 'NMaxStreets': 1}, {'NKeep': 30, 'NMaxStreets': 2}]
+    workers: int
+        optional, default None. Number of points solved at once
+    
+    Returns
+    -------
+    results: list
+        solveModel result for each point with the point's parameters
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+
+    modelDict = prob.to_dict()
+    varNames = {dv: var.name for dv, var in modelVars.items()}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_solvePoint, modelDict, varNames, dvData, point)
+                   for point in points]
+        return [future.result() for future in futures]
@@ -0,0 +1,324 @@
+import json
+import os
+import tempfile
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def readUsernames(path):
+    '''
+    Reads one username per line, skipping blank lines and # comments
+    
+    Parameters
+    ----------
+    path: str
+        usernames file
+    
+    Returns
+    -------
+    usernames: list
+        usernames in file order without duplicates
+    '''
+    with open(path) as f:
+        usernames = [line.split('#')[0].strip() for line in f]
+    return list(dict.fromkeys(username for username in usernames if username))
+
+
+def shardOf(username, NShards):
+    '''
+    Shard a username belongs to. Stable across processes and machines so
+    every node agrees without coordination.
+    
+    Parameters
+    ----------
+    username: str
+        Upland username
+    NShards: int
+        total number of shards
+    
+    Returns
+    -------
+    shard: int
+        shard index in range(NShards)
+    '''
+    return zlib.crc32(username.encode('utf-8')) % NShards
+
+
+def shardPath(outDir, shard):
+    '''
+    Checkpoint file of a shard, f'{outDir}/shard-{shard:04d}.jsonl'
+    '''
+    return os.path.join(outDir, f'shard-{shard:04d}.jsonl')
+
+
+def checkManifest(outDir, NShards):
+    '''
+    Records NShards in f'{outDir}/manifest.json' on first use and refuses
+    a different NShards later, since changing it would reassign users 
+    and ignore their checkpoints. Safe when several nodes start at once.
+    
+    Parameters
+    ----------
+    outDir: str
+        directory of shard checkpoint files
+    NShards: int
+        total number of shards
+    
+    Returns
+    -------
+    None
+    '''
+    if NShards < 1:
+        raise ValueError(f'NShards must be at least 1 not {NShards}')
+    os.makedirs(outDir, exist_ok=True)
+    path = os.path.join(outDir, 'manifest.json')
+    if not os.path.exists(path):
+        # Link a complete temp file into place so the first node wins and 
+        # nobody reads a partial manifest
+        fd, tmpPath = tempfile.mkstemp(dir=outDir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'shards': NShards}, f)
+            os.link(tmpPath, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmpPath)
+    recorded = readManifest(outDir)
+    if recorded != NShards:
+        raise ValueError(f'{outDir} was started with {recorded} shards, '
+                         f'not {NShards}')
+
+
+def readManifest(outDir):
+    '''
+    NShards recorded for outDir, see checkManifest
+    '''
+    with open(os.path.join(outDir, 'manifest.json')) as f:
+        return json.load(f)['shards']
+
+
+def checkShard(shard, NShards):
+    '''
+    Raises ValueError unless 0 <= shard < NShards
+    '''
+    if not 0 <= shard < NShards:
+        raise ValueError(f'shard must be in range(0, {NShards}) not {shard}')
+
+
+def lockShard(outDir, shard):
+    '''
+    Takes an exclusive, non-blocking lock on a shard so only one worker
+    repairs and appends to its checkpoint. The lock is released when the
+    returned file is closed or the process dies.
+    
+    Parameters
+    ----------
+    outDir: str
+        directory of shard checkpoint files
+    shard: int
+        shard to lock
+    
+    Returns
+    -------
+    lock: file or None
+        open lock file, None if another worker holds the lock
+    '''
+    lock = open(os.path.join(outDir, f'shard-{shard:04d}.lock'), 'a')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+def readCheckpoint(path, repair=False):
+    '''
+    Reads the finished users of a shard. Each line holds every record of
+    one user, so a user is either fully checkpointed or not at all.
+    
+    Parameters
+    ----------
+    path: str
+        shard checkpoint file
+    repair: bool
+        optional, default False. If True cut a partial last line left by
+        a crash so appending can resume
+    
+    Returns
+    -------
+    done: dict
+        username -> checkpoint entry
+    '''
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb+' if repair else 'rb') as f:
+        data = f.read()
+        complete = data[:data.rfind(b'\n') + 1]
+        if repair and len(complete) < len(data):
+            f.truncate(len(complete))
+    for line in complete.splitlines():
+        entry = json.loads(line)
+        done[entry['username']] = entry
+    return done
+
+
+def runShard(usernames, shard, NShards, outDir, auth=None):
+    '''
+    Optimizes the users of one shard, checkpointing after every user. 
+    Users already in the checkpoint are skipped, so rerunning a crashed 
+    shard resumes where it stopped. Failed users are reported and left
+    out of the checkpoint to be retried on the next run. A shard locked
+    by another worker is skipped and reported as locked.
+    
+    Parameters
+    ----------
+    usernames: list
+        all usernames of the batch
+    shard: int
+        shard to run
+    NShards: int
+        total number of shards
+    outDir: str
+        directory of shard checkpoint files, may be on a shared filesystem
+    auth: str
+        optional, default None. Authentication token, see 
+        apply_active_collections
+    
+    Returns
+    -------
+    summary: dict
+        'shard', 'locked', and 'optimized', 'skipped' and 'failed' 
+        usernames
+    '''
+    checkShard(shard, NShards)
+    checkManifest(outDir, NShards)
+    summary = {'shard': shard, 'locked': False, 
+               'optimized': [], 'skipped': [], 'failed': []}
+    lock = lockShard(outDir, shard)
+    if lock is None:
+        print(f'Shard {shard} is locked by another worker, skipping')
+        summary['locked'] = True
+        return summary
+    with lock:
+        return _runLockedShard(usernames, shard, NShards, outDir, auth, summary)
+
+
+def _runLockedShard(usernames, shard, NShards, outDir, auth, summary):
+    '''
+    Body of runShard, called while holding the shard lock
+    '''
+    from optProps import optimizeCollections
+    from output import solution_records
+
+    user_properties = None
+    if auth:
+        from utilities import get_user_properties_data, apply_active_collections
+        user_properties = get_user_properties_data(auth)
+
+    path = shardPath(outDir, shard)
+    done = readCheckpoint(path, repair=True)
+    with open(path, 'a') as f:
+        for username in usernames:
+            if shardOf(username, NShards) != shard:
+                continue
+            if username in done:
+                summary['skipped'].append(username)
+                continue
+            try:
+                solution = optimizeCollections(username, lpFile=None)
+                if user_properties is not None:
+                    solution = apply_active_collections(user_properties, solution)
+            except Exception as e:
+                print(f'ERROR: {username} failed: {e}')
+                summary['failed'].append(username)
+                continue
+            entry = {'username': username,
+                     'user': list(solution_records(username, solution, 'user')),
+                     'assignment': list(solution_records(username, solution, 
+                                                         'assignment')),
+                    }
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            summary['optimized'].append(username)
+    return summary
+
+
+def runShards(usernames, NShards, outDir, shards=None, workers=None, 
+              auth=None):
+    '''
+    Runs shards as independent worker processes on this machine. To 
+    spread a batch over nodes sharing outDir give each node its own 
+    shards.
+    
+    Parameters
+    ----------
+    usernames: list
+        all usernames of the batch
+    NShards: int
+        total number of shards
+    outDir: str
+        directory of shard checkpoint files
+    shards: list
+        optional, default all. Shards to run here
+    workers: int
+        optional, default None. Number of worker processes
+    auth: str
+        optional, default None. Authentication token, see runShard
+    
+    Returns
+    -------
+    summaries: list
+        runShard summary of each shard
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    checkManifest(outDir, NShards)
+    if shards is None:
+        shards = range(NShards)
+    for shard in shards:
+        checkShard(shard, NShards)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(runShard, usernames, shard, NShards, outDir,
+                                   auth)
+                   for shard in shards]
+        return [future.result() for future in futures]
+
+
+def mergeShards(outDir, sink):
+    '''
+    Streams the checkpointed results of every shard in the manifest 
+    into one sink
+    
+    Parameters
+    ----------
+    outDir: str
+        directory of shard checkpoint files
+    sink: SolutionSink
+        output, its level selects user or assignment records
+    
+    Returns
+    -------
+    NUsers: int
+        number of users merged
+    '''
+    merged = set()
+    for shard in range(readManifest(outDir)):
+        done = readCheckpoint(shardPath(outDir, shard))
+        for username, entry in done.items():
+            if username in merged:
+                continue
+            sink.writeRecords(entry[sink.level])
+            merged.add(username)
+    return len(merged)
@@ -0,0 +1,265 @@
+import argparse
+import sys
+
+
+def readKey(keyFile):
+    '''
+    Reads the Upland authentication token if the key file exists
+    
+    Parameters
+    ----------
+    keyFile: str
+        path to the key file
+    
+    Returns
+    -------
+    auth: str or None
+        Authentication token, None if the file cannot be read
+    '''
+    try:
+        f = open(keyFile, "r")
+    except OSError:
+        return None
+    with f:
+        auth = f.read().strip()
+    return auth or None
+
+
+def optimize(args):
+    '''
+    Optimizes each username and writes the requested outputs
+    '''
+    # Heavy dependencies (pandas, pulp, requests) load only here
+    from optProps import optimizeCollections
+    from output import SolutionSink
+    from utilities import (write_solution, apply_active_collections, 
+                           get_user_properties_data)
+
+    # The key belongs to one account; its holdings are fetched once and
+    # only applied to the user who owns them
+    auth = readKey(args.key)
+    user_properties = get_user_properties_data(auth) if auth else None
+    sink = None
+    if args.output:
+        sink = SolutionSink(args.output, fmt=args.format, level=args.level,
+                            append=args.append)
+    try:
+        for username in args.usernames:
+            optimized = optimizeCollections(username)
+            if user_properties is not None:
+                optimized = apply_active_collections(user_properties, optimized)
+            if sink is not None:
+                sink.write(username, optimized)
+            if args.report:
+                write_solution(username, optimized)
+    finally:
+        if sink is not None:
+            sink.close()
+    return 0
+
+
+def batch(args):
+    '''
+    Runs a sharded, checkpointed batch and optionally merges the shards
+    '''
+    from batch import readUsernames, runShards
+
+    usernames = readUsernames(args.usernames)
+    try:
+        summaries = runShards(usernames, args.shards, args.out, 
+                              shards=args.shard, workers=args.workers,
+                              auth=readKey(args.key))
+    except ValueError as e:
+        print(f'ERROR: {e}')
+        return 2
+    failed = []
+    locked = []
+    for summary in summaries:
+        if summary['locked']:
+            locked.append(summary['shard'])
+            continue
+        print(f"Shard {summary['shard']}: {len(summary['optimized'])} optimized, "
+              f"{len(summary['skipped'])} resumed, {len(summary['failed'])} failed")
+        failed.extend(summary['failed'])
+    if locked:
+        print(f'Shards {locked} are held by other workers, not merging')
+        return 1
+    if failed:
+        print(f'{len(failed)} users failed, rerun to retry them before merging')
+        return 1
+    if args.output:
+        args.dir = args.out
+        merge(args)
+    return 0
+
+
+def merge(args):
+    '''
+    Merges finished shards into one output file, replacing it only once
+    the merge is complete
+    '''
+    import os
+    from batch import mergeShards
+    from output import SolutionSink
+
+    tmpPath = f'{args.output}.tmp'
+    try:
+        with SolutionSink(tmpPath, fmt=args.format, level=args.level) as sink:
+            NUsers = mergeShards(args.dir, sink)
+        os.replace(tmpPath, args.output)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+    print(f'Merged {NUsers} users into {args.output}')
+    return 0
+
+
+def status(args):
+    '''
+    Reports which dependencies are installed and whether a key file is
+    present without importing any of them
+    '''
+    from importlib.util import find_spec
+    from os import environ
+
+    for module in ['pandas', 'numpy', 'pulp', 'requests', 'pyarrow']:
+        installed = 'installed' if find_spec(module) else 'missing'
+        print(f'{module:<10}: {installed}')
+    key = 'found' if readKey(args.key) else 'not found'
+    print(f'{"key":<10}: {key} ({args.key})')
+    print(f'{"mode":<10}: {environ.get("UPOPT_MODE", "live")}')
+    return 0
+
+
+def serve(args):
+    '''
+    Runs the local stand-in API server until interrupted
+    '''
+    from replay import makeServer
+
+    server = makeServer(args.fixtures, args.host, args.port, 
+                        latency=args.latency, errorRate=args.error_rate,
+                        seed=args.seed)
+    host, port = server.server_address[:2]
+    print(f'Serving {args.fixtures} on http://{host}:{port}')
+    print(f'  --upland-api http://{host}:{port}/upland '
+          f'--upx-api http://{host}:{port}/upx')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def buildParser():
+    '''
+    Builds the command line parser
+    
+    Returns
+    -------
+    parser: ArgumentParser
+        parser with one subcommand per action
+    '''
+    parser = argparse.ArgumentParser(prog='upOpt',
+        description='Optimize Upland collection assignments')
+    parser.add_argument('--key', default='key.txt', 
+        help='file holding the Upland auth token (default: key.txt)')
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument('--record', metavar='DIR',
+        help='save every API response to fixtures in DIR')
+    fixtures.add_argument('--replay', metavar='DIR',
+        help='answer API calls from fixtures in DIR, no network')
+    parser.add_argument('--upland-api', help='base URL for api.upland.me')
+    parser.add_argument('--upx-api', help='base URL for api.upx.world')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    opt = subparsers.add_parser('optimize', help='optimize users')
+    opt.add_argument('usernames', nargs='+', help='Upland usernames')
+    opt.add_argument('--report', action='store_true',
+        help='write the {username}.txt text report')
+    opt.add_argument('--output', 
+        help='write records to this file, replacing it unless --append')
+    opt.add_argument('--append', action='store_true',
+        help='append to an existing --output file (jsonl only)')
+    opt.add_argument('--format', choices=['jsonl', 'parquet'], 
+        default='jsonl', help='output format (default: jsonl)')
+    opt.add_argument('--level', choices=['user', 'assignment'], 
+        default='user', help='one record per user or per assignment')
+    opt.set_defaults(func=optimize)
+
+    bat = subparsers.add_parser('batch', 
+        help='optimize a user list in checkpointed shards')
+    bat.add_argument('usernames', help='file with one username per line')
+    bat.add_argument('--out', required=True, 
+        help='checkpoint directory, may be shared between nodes')
+    bat.add_argument('--shards', type=int, default=1, 
+        help='total number of shards (default: 1)')
+    bat.add_argument('--shard', type=int, action='append',
+        help='shard to run on this node, repeatable (default: all)')
+    bat.add_argument('--workers', type=int, 
+        help='worker processes on this node')
+    bat.add_argument('--output', 
+        help='if no user failed, merge all shards into this file (replaced)')
+    bat.add_argument('--format', choices=['jsonl', 'parquet'], 
+        default='jsonl', help='merged format (default: jsonl)')
+    bat.add_argument('--level', choices=['user', 'assignment'], 
+        default='user', help='one record per user or per assignment')
+    bat.set_defaults(func=batch)
+
+    mrg = subparsers.add_parser('merge', 
+        help='merge finished shards into one file')
+    mrg.add_argument('dir', help='checkpoint directory')
+    mrg.add_argument('output', help='merged output file (replaced)')
+    mrg.add_argument('--format', choices=['jsonl', 'parquet'], 
+        default='jsonl', help='output format (default: jsonl)')
+    mrg.add_argument('--level', choices=['user', 'assignment'], 
+        default='user', help='one record per user or per assignment')
+    mrg.set_defaults(func=merge)
+
+    stat = subparsers.add_parser('status', 
+        help='show installed dependencies and key file')
+    stat.set_defaults(func=status)
+
+    srv = subparsers.add_parser('serve', 
+        help='serve recorded fixtures as a local stand-in API')
+    srv.add_argument('fixtures', help='fixture directory')
+    srv.add_argument('--host', default='127.0.0.1')
+    srv.add_argument('--port', type=int, default=8080)
+    srv.add_argument('--latency', type=float, default=0.0,
+        help='seconds added to every response')
+    srv.add_argument('--error-rate', type=float, default=0.0,
+        help='fraction of requests answered with 503')
+    srv.add_argument('--seed', type=int, help='seed for error injection')
+    srv.set_defaults(func=serve)
+    return parser
+
+
+def main(argv=None):
+    '''
+    Command line entry point
+    
+    Parameters
+    ----------
+    argv: list
+        optional, default sys.argv[1:]. Command line arguments
+    
+    Returns
+    -------
+    code: int
+        exit code
+    '''
+    args = buildParser().parse_args(argv)
+    if args.record or args.replay or args.upland_api or args.upx_api:
+        from replay import configure
+
+        mode = 'record' if args.record else 'replay' if args.replay else None
+        configure(mode=mode, fixtures=args.record or args.replay,
+                  upland=args.upland_api, upx=args.upx_api)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,10 @@
 from utilities import (getUserProperty, kingOfTheStreet, collectionsDict, 
-                       getCollections, write_solution, check_active_colletions,
-                       get_user_properties_data)
+                       getCollections, write_solution)
 from ILP import optimizeCollection
-from sys import argv
-import pandas as pd
-from os import path
 import numpy as np
-import itertools 
-import requests
-import timeit 
-import pulp
-import sys
-import ast
 
-def optimizeCollections(username, write=False):
+def optimizeCollections(username, write=False, sink=None, 
+                        lpFile='Collections.lp'):
     '''
     Runs an integer linear programming optimization for a user'seek
     properties by splitting up the problem into 2 categories (high and 
@@ -25,6 +16,12 @@ def optimizeCollections(username, write=False):
         username to query
     write: bool
         optional, default False. If True write solution to txt file
+    sink: SolutionSink
+        optional, default None. If given the solution records are 
+        appended to the sink
+    lpFile: str
+        optional, default 'Collections.lp'. File each ILP is written to,
+        None to skip
     
     Returns
     -------
@@ -34,7 +31,6 @@ def optimizeCollections(username, write=False):
 
     allCollections = getCollections()
 
-    username=argv[1]
     properties = getUserProperty(username)
     propertiesRemaining = properties.copy(deep=True)
 
@@ -58,7 +54,7 @@ def optimizeCollections(username, write=False):
     optimizeOver= set(dvData.collectionID.values.tolist()) - set(lowYieldIDs)
     highYieldDVs = dvData[dvData.collectionID.isin(optimizeOver)]
 
-    prob = optimizeCollection(highYieldDVs, allCollections)
+    prob = optimizeCollection(highYieldDVs, allCollections, lpFile=lpFile)
     # Each of the variables is printed with it's resolved optimum value
     for collectionID in highYieldDVs.collectionID.unique(): 
         solutions[int(collectionID)] = []
@@ -82,7 +78,7 @@ def optimizeCollections(username, write=False):
     
     lowYieldDVs = dvData[dvData.collectionID.isin(lowYieldIDs)]   
     #import ipdb; ipdb.set_trace()
-    prob = optimizeCollection(lowYieldDVs, allCollections)
+    prob = optimizeCollection(lowYieldDVs, allCollections, lpFile=lpFile)
     # Each of the variables is printed with it's resolved optimum value
     for collectionID in lowYieldDVs.collectionID.unique(): 
         solutions[int(collectionID)] = []
@@ -154,6 +150,8 @@ def optimizeCollections(username, write=False):
         collections[collectionID]['properties'] = addresses
     collection['collections'] = collections
                   
+    if sink is not None:
+        sink.write(username, collection)
     if write:     
         write_solution(username, collection)
                      
@@ -163,18 +161,6 @@ def optimizeCollections(username, write=False):
     
     
 if __name__ == '__main__':    
-    username = argv[1]        
-    optimized = optimizeCollections(username, write=True)
-    try:
-        f = open("key.txt", "r")
-    except:
-        auth = None
-    else:
-        auth = f.read()
-    
-    if auth:   
-        user_properties = get_user_properties_data(auth)        
-        optimized = check_active_colletions(user_properties, optimized)
-        write_solution(username, optimized)
-    import ipdb; ipdb.set_trace()
-                
\ No newline at end of file
+    import sys
+    from cli import main
+    sys.exit(main(['optimize', '--report'] + sys.argv[1:]))
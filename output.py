@@ -0,0 +1,192 @@
+import json
+import math
+
+
+def _native(value):
+    '''
+    Converts numpy scalars to built-in Python types and NaN to None so
+    records can be serialized
+    
+    Parameters
+    ----------
+    value: object
+        value to convert
+    
+    Returns
+    -------
+    value: object
+        built-in equivalent of value
+    '''
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def solution_records(username, solution, level='user'):
+    '''
+    Flattens an optimized solution into records
+    
+    Parameters
+    ----------
+    username: str
+        user name
+    solution: dictionary
+        solution dictionary
+    level: str
+        optional, default 'user'. 'user' yields one summary record, 
+        'assignment' yields one record per property in a collection. 
+        'active' is None unless check_active_colletions was run
+    
+    Returns
+    -------
+    records: generator
+        dictionaries of built-in types
+    '''
+    if level == 'user':
+        earnings = solution['earnings']
+        yield {'username': username,
+               'base_earnings': _native(earnings['base_earnings']),
+               'collection_earnings': _native(earnings['collection_earnings']),
+               'total_earnings': _native(earnings['total_earnings']),
+               'active_collections': sum(1 for props in solution['ILPSolution'].values()
+                                         if props),
+              }
+    elif level == 'assignment':
+        for collectionID, collection in solution['collections'].items():
+            for address, prop in collection['properties'].items():
+                yield {'username': username,
+                       'collection_id': _native(collectionID),
+                       'collection_name': _native(collection['name']),
+                       'property_id': int(prop['id']),
+                       'address': address,
+                       'mint': _native(prop['mint']),
+                       'active': _native(prop.get('active')),
+                      }
+    else:
+        raise ValueError(f"level must be 'user' or 'assignment' not {level}")
+
+
+# Field names and pyarrow types of the records of each level
+RECORD_SCHEMAS = {'user': [('username', 'string'),
+                           ('base_earnings', 'float64'),
+                           ('collection_earnings', 'float64'),
+                           ('total_earnings', 'float64'),
+                           ('active_collections', 'int64'),
+                          ],
+                  'assignment': [('username', 'string'),
+                                 ('collection_id', 'int64'),
+                                 ('collection_name', 'string'),
+                                 ('property_id', 'int64'),
+                                 ('address', 'string'),
+                                 ('mint', 'float64'),
+                                 ('active', 'bool_'),
+                                ],
+                 }
+
+
+class SolutionSink:
+    '''
+    Streams solution records to a single JSON Lines or Parquet file. 
+    The file is created, or overwritten, when the sink is opened and 
+    every write appends to it until close(). JSON Lines can instead 
+    append to an existing file with append=True; Parquet files cannot be
+    reopened for appending. Parquet requires pyarrow and uses the fixed
+    schema in RECORD_SCHEMAS.
+    
+    Parameters
+    ----------
+    path: str
+        output file
+    fmt: str
+        optional, default 'jsonl'. 'jsonl' or 'parquet'
+    level: str
+        optional, default 'user'. See solution_records
+    append: bool
+        optional, default False. If True keep the records already in a
+        JSON Lines file
+    '''
+    def __init__(self, path, fmt='jsonl', level='user', append=False):
+        if fmt not in ('jsonl', 'parquet'):
+            raise ValueError(f"fmt must be 'jsonl' or 'parquet' not {fmt}")
+        if level not in RECORD_SCHEMAS:
+            raise ValueError(f"level must be 'user' or 'assignment' not {level}")
+        if append and fmt == 'parquet':
+            raise ValueError('Parquet files cannot be appended to')
+        self.path = path
+        self.fmt = fmt
+        self.level = level
+        self._file = None
+        self._writer = None
+        if fmt == 'jsonl':
+            self._file = open(path, 'a' if append else 'w')
+        else:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError('Parquet output requires pyarrow')
+            self._pa = pyarrow
+            self._schema = pyarrow.schema(
+                [(name, getattr(pyarrow, dtype)()) 
+                 for name, dtype in RECORD_SCHEMAS[level]])
+            self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, username, solution):
+        '''
+        Appends the records of one user's solution
+        
+        Parameters
+        ----------
+        username: str
+            user name
+        solution: dictionary
+            solution dictionary
+        
+        Returns
+        -------
+        N: int
+            number of records written
+        '''
+        records = list(solution_records(username, solution, self.level))
+        return self.writeRecords(records)
+
+    def writeRecords(self, records):
+        '''
+        Appends already flattened records, see solution_records
+        
+        Parameters
+        ----------
+        records: list
+            record dictionaries
+        
+        Returns
+        -------
+        N: int
+            number of records written
+        '''
+        if not records:
+            return 0
+        if self.fmt == 'jsonl':
+            for record in records:
+                self._file.write(json.dumps(record, allow_nan=False) + '\n')
+            self._file.flush()
+        else:
+            table = self._pa.Table.from_pylist(records, schema=self._schema)
+            self._writer.write_table(table)
+        return len(records)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
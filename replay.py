@@ -0,0 +1,217 @@
+import json
+import os
+import random
+import tempfile
+import time
+
+
+# Base URLs can point at a local stand-in server, e.g.
+#   UPOPT_UPLAND_API=http://127.0.0.1:8080/upland
+#   UPOPT_UPX_API=http://127.0.0.1:8080/upx
+APIS = {'upland': ('UPOPT_UPLAND_API', 'https://api.upland.me'),
+        'upx': ('UPOPT_UPX_API', 'https://api.upx.world'),
+       }
+MODES = ['live', 'record', 'replay']
+
+
+def configure(mode=None, fixtures=None, upland=None, upx=None):
+    '''
+    Sets the request mode, fixture directory and API base URLs. Settings
+    are stored in environment variables so worker processes inherit them.
+    
+    Parameters
+    ----------
+    mode: str
+        optional. 'live', 'record' (live and save responses) or 'replay'
+        (serve saved responses only)
+    fixtures: str
+        optional. Directory of recorded responses
+    upland: str
+        optional. Base URL for api.upland.me
+    upx: str
+        optional. Base URL for api.upx.world
+    
+    Returns
+    -------
+    None
+    '''
+    if mode is not None:
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES} not {mode}')
+        os.environ['UPOPT_MODE'] = mode
+    if fixtures is not None:
+        os.environ['UPOPT_FIXTURES'] = fixtures
+    if upland is not None:
+        os.environ[APIS['upland'][0]] = upland
+    if upx is not None:
+        os.environ[APIS['upx'][0]] = upx
+
+
+def fixturePath(api, route, fixtures=None):
+    '''
+    Location of the recorded response for a route. Routes that would 
+    resolve outside the fixture directory are rejected.
+    
+    Parameters
+    ----------
+    api: str
+        'upland' or 'upx'
+    route: str
+        decoded path below the API base URL, e.g. '/collections'
+    fixtures: str
+        optional, default $UPOPT_FIXTURES or 'fixtures'
+    
+    Returns
+    -------
+    path: str
+        f'{fixtures}/{api}/{route}.json'
+    '''
+    if api not in APIS:
+        raise ValueError(f'Unknown api {api}')
+    if fixtures is None:
+        fixtures = os.environ.get('UPOPT_FIXTURES', 'fixtures')
+    base = os.path.abspath(os.path.join(fixtures, api))
+    path = os.path.normpath(os.path.join(base, route.strip('/')) + '.json')
+    if os.path.commonpath([base, path]) != base:
+        raise ValueError(f'Route {route} is outside the fixture directory')
+    return path
+
+
+def fetchJSON(api, route, headers=None, retries=3, backoff=0.5, timeout=30):
+    '''
+    GETs an API route and returns the decoded JSON. Depending on 
+    $UPOPT_MODE the response is fetched live, fetched and recorded, or
+    replayed from the fixture directory without touching the network.
+    Connection errors, timeouts, 429 and 5xx responses are retried with 
+    exponential backoff.
+    
+    Parameters
+    ----------
+    api: str
+        'upland' or 'upx'
+    route: str
+        path below the API base URL
+    headers: dict
+        optional, request headers. Never recorded
+    retries: int
+        optional, default 3. Retries after the first attempt
+    backoff: float
+        optional, default 0.5. Seconds before the first retry, doubled
+        after each
+    timeout: float
+        optional, default 30. Seconds per request
+    
+    Returns
+    -------
+    data: dict or list
+        decoded JSON response
+    '''
+    mode = os.environ.get('UPOPT_MODE', 'live')
+    if mode not in MODES:
+        raise ValueError(f'UPOPT_MODE must be one of {MODES} not {mode}')
+    if mode != 'live':
+        path = fixturePath(api, route)
+    if mode == 'replay':
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f'No recorded response for {api}{route}: {path}')
+
+    import requests
+    envVar, default = APIS[api]
+    url = os.environ.get(envVar, default).rstrip('/') + route
+    for attempt in range(retries + 1):
+        try:
+            response = requests.get(url, headers=headers, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, 
+                requests.HTTPError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+        else:
+            break
+    response.raise_for_status()
+    data = response.json()
+
+    if mode == 'record':
+        # Write then rename so concurrent readers never see a partial file
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
+    return data
+
+
+def makeServer(fixtures, host='127.0.0.1', port=8080, latency=0.0, 
+               errorRate=0.0, seed=None):
+    '''
+    Builds a local stand-in for the Upland APIs that serves recorded
+    fixtures. GET /upland/collections returns 
+    {fixtures}/upland/collections.json and so on.
+    
+    Parameters
+    ----------
+    fixtures: str
+        directory of recorded responses
+    host: str
+        optional, default '127.0.0.1'
+    port: int
+        optional, default 8080. 0 picks a free port
+    latency: float
+        optional, default 0. Seconds to wait before each response
+    errorRate: float
+        optional, default 0. Fraction of requests answered with 503
+    seed: int
+        optional. Seed for the error injection
+    
+    Returns
+    -------
+    server: ThreadingHTTPServer
+        call serve_forever() to start
+    '''
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import unquote, urlsplit
+    from threading import Lock
+
+    rng = random.Random(seed)
+    rngLock = Lock()
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            with rngLock:
+                fail = rng.random() < errorRate
+            if fail:
+                self.send_error(503, 'Injected error')
+                return
+            requested = unquote(urlsplit(self.path).path)
+            api, _, route = requested.lstrip('/').partition('/')
+            try:
+                path = fixturePath(api, route, fixtures)
+            except ValueError:
+                path = None
+            if path is None or not os.path.isfile(path):
+                self.send_error(404, f'No fixture for {requested}')
+                return
+            with open(path, 'rb') as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), FixtureHandler)
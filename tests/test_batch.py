@@ -0,0 +1,149 @@
+import json
+import os
+import sys
+import types
+
+import pytest
+
+from batch import (readUsernames, shardOf, shardPath, checkManifest, 
+                   readManifest, readCheckpoint, lockShard, runShard, 
+                   runShards, mergeShards)
+
+
+class ListSink:
+    level = 'user'
+
+    def __init__(self):
+        self.records = []
+
+    def writeRecords(self, records):
+        self.records.extend(records)
+        return len(records)
+
+
+def entry(username):
+    return {'username': username, 
+            'user': [{'username': username}], 
+            'assignment': []}
+
+
+def solution(username):
+    return {'ILPSolution': {7: ['5']},
+            'earnings': {'base_earnings': 1.0, 'collection_earnings': 0.5,
+                         'total_earnings': 1.5},
+            'collections': {7: {'name': 'Newbie', 'properties': 
+                                {f'{username} St': {'id': '5', 'mint': 1.0}}}},
+           }
+
+
+@pytest.fixture
+def optimizer(monkeypatch):
+    '''
+    Stands in for optProps.optimizeCollections, failing for the 
+    usernames in optimizer.failing and recording every call
+    '''
+    def optimizeCollections(username, lpFile='Collections.lp'):
+        stub.calls.append(username)
+        if username in stub.failing:
+            raise RuntimeError('API down')
+        return solution(username)
+
+    stub = types.SimpleNamespace(optimizeCollections=optimizeCollections,
+                                 calls=[], failing=set())
+    monkeypatch.setitem(sys.modules, 'optProps', stub)
+    return stub
+
+
+def writeShard(outDir, shard, lines):
+    with open(shardPath(outDir, shard), 'w') as f:
+        f.write(lines)
+
+
+def test_read_usernames(tmp_path):
+    path = tmp_path / 'users.txt'
+    path.write_text('bob\n\n# comment\nalice # note\nbob\ncarol\n')
+    assert readUsernames(path) == ['bob', 'alice', 'carol']
+
+
+def test_shard_of_is_stable():
+    assert shardOf('alice', 4) == shardOf('alice', 4)
+    assert {shardOf(f'user{i}', 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_manifest(tmp_path):
+    outDir = str(tmp_path / 'out')
+    checkManifest(outDir, 2)
+    checkManifest(outDir, 2)
+    assert readManifest(outDir) == 2
+    assert os.listdir(outDir) == ['manifest.json']
+    with pytest.raises(ValueError):
+        checkManifest(outDir, 3)
+
+
+@pytest.mark.parametrize('shards', [[5], [-1], [0, 2]])
+def test_run_shards_rejects_bad_shard(tmp_path, shards):
+    outDir = str(tmp_path / 'out')
+    with pytest.raises(ValueError):
+        runShards(['bob'], 2, outDir, shards=shards)
+    assert not os.path.exists(shardPath(outDir, 5))
+
+
+def test_read_checkpoint_repairs_partial_line(tmp_path):
+    outDir = str(tmp_path)
+    writeShard(outDir, 0, json.dumps(entry('a')) + '\n{"username": "b", "us')
+    assert list(readCheckpoint(shardPath(outDir, 0))) == ['a']
+    assert list(readCheckpoint(shardPath(outDir, 0), repair=True)) == ['a']
+    with open(shardPath(outDir, 0)) as f:
+        assert f.read().endswith('[]}\n')
+
+
+def test_merge_uses_manifest_shards(tmp_path):
+    outDir = str(tmp_path)
+    checkManifest(outDir, 2)
+    writeShard(outDir, 0, json.dumps(entry('a')) + '\n')
+    writeShard(outDir, 1, json.dumps(entry('b')) + '\n' + json.dumps(entry('a')) + '\n')
+    writeShard(outDir, 7, json.dumps(entry('stale')) + '\n')
+    sink = ListSink()
+    assert mergeShards(outDir, sink) == 2
+    assert sink.records == [{'username': 'a'}, {'username': 'b'}]
+
+
+def test_run_shard_resumes_and_retries_failures(tmp_path, optimizer):
+    outDir = str(tmp_path)
+    optimizer.failing = {'bad'}
+    summary = runShard(['a', 'bad', 'b'], 0, 1, outDir)
+    assert summary['optimized'] == ['a', 'b']
+    assert summary['failed'] == ['bad']
+    assert list(readCheckpoint(shardPath(outDir, 0))) == ['a', 'b']
+
+    optimizer.calls.clear()
+    optimizer.failing = set()
+    summary = runShard(['a', 'bad', 'b'], 0, 1, outDir)
+    assert optimizer.calls == ['bad']
+    assert summary['skipped'] == ['a', 'b']
+    assert summary['optimized'] == ['bad']
+    assert summary['failed'] == []
+    done = readCheckpoint(shardPath(outDir, 0))
+    assert list(done) == ['a', 'b', 'bad']
+    assert done['bad']['assignment'][0]['address'] == 'bad St'
+
+
+def test_run_shard_only_runs_its_users(tmp_path, optimizer):
+    usernames = [f'user{i}' for i in range(20)]
+    runShard(usernames, 1, 3, str(tmp_path))
+    assert optimizer.calls == [u for u in usernames if shardOf(u, 3) == 1]
+
+
+def test_run_shard_skips_locked_shard(tmp_path, optimizer):
+    outDir = str(tmp_path)
+    checkManifest(outDir, 1)
+    lock = lockShard(outDir, 0)
+    try:
+        assert lockShard(outDir, 0) is None
+        summary = runShard(['a'], 0, 1, outDir)
+    finally:
+        lock.close()
+    assert summary['locked']
+    assert optimizer.calls == []
+    assert not os.path.exists(shardPath(outDir, 0))
+    assert runShard(['a'], 0, 1, outDir)['optimized'] == ['a']
@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ['pandas', 'numpy', 'pulp', 'requests', 'pyarrow']
+# Total self import time budget for 'cli.py status' in microseconds
+IMPORT_BUDGET = 150000
+
+
+def run(*args):
+    '''
+    Runs a fresh interpreter from the repo root with import timing 
+    enabled and returns the completed process
+    '''
+    return subprocess.run([sys.executable, '-X', 'importtime', *args],
+                          cwd=ROOT, capture_output=True, text=True, 
+                          timeout=60)
+
+
+def heavyImports(argv):
+    '''
+    Runs cli.main(argv) in a fresh interpreter and returns the heavy 
+    modules it loaded
+    '''
+    result = run('-c', "import sys, cli\n"
+                 f"cli.main({argv!r})\n"
+                 f"print(sorted(set({HEAVY!r}) & set(sys.modules)))")
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_status_skips_heavy_imports():
+    assert heavyImports(['status']) == '[]'
+
+
+def test_merge_skips_heavy_imports(tmp_path):
+    outDir = tmp_path / 'out'
+    outDir.mkdir()
+    (outDir / 'manifest.json').write_text(json.dumps({'shards': 1}))
+    entry = {'username': 'bob', 'user': [{'username': 'bob'}], 'assignment': []}
+    (outDir / 'shard-0000.jsonl').write_text(json.dumps(entry) + '\n')
+    merged = tmp_path / 'merged.jsonl'
+    assert heavyImports(['merge', str(outDir), str(merged)]) == '[]'
+    assert merged.read_text() == json.dumps({'username': 'bob'}) + '\n'
+
+
+def test_status_import_time_budget():
+    result = run('cli.py', 'status')
+    assert result.returncode == 0, result.stderr
+    imported = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        selfTime, _, name = line[len('import time:'):].split('|')
+        imported[name.strip()] = int(selfTime)
+    assert not set(HEAVY) & set(imported)
+    assert sum(imported.values()) < IMPORT_BUDGET
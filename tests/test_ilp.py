@@ -0,0 +1,118 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+np = pytest.importorskip('numpy')
+pytest.importorskip('pulp')
+
+from ILP import (buildModel, setObjective, limitMoves, requireCollections, 
+                 keepMask, solveModel, sweep)
+from utilities import collectionsDict, kingOfTheStreet
+
+
+@pytest.fixture
+def allCollections():
+    return pd.DataFrame({'id': [50, 21, 1, 72, 11, 7],
+                         'name': ['High', 'City Pro', 'King of the Street',
+                                  'Brooklyner', 'San Franciscan', 'Newbie'],
+                         'amount': [2, 3, 3, 3, 3, 3],
+                         'yield_boost': [2.0, 1.4, 1.3, 1.25, 1.2, 1.1],
+                        })
+
+
+@pytest.fixture
+def properties():
+    # Two cities with two streets each; repeated yields exercise ties
+    yields = [5, 5, 3, 8, 2, 2, 7, 1, 4, 6, 6, 3, 9, 1, 2, 2]
+    rows = []
+    for i, yield_per_hour in enumerate(yields):
+        collections = np.nan
+        if i in (3, 12):
+            collections = [{'id': 50, 'yield_boost': 2.0}]
+        rows.append({'prop_id': 100 + i,
+                     'city_id': 1 if i < 8 else 2,
+                     'street_id': 10 + i // 4,
+                     'full_address': f'{i} Main St',
+                     'yield_per_hour': float(yield_per_hour),
+                     'mint_price': 1000.0 * yield_per_hour,
+                     'collections': collections,
+                    })
+    return pd.DataFrame(rows, index=[row['prop_id'] for row in rows])
+
+
+@pytest.fixture
+def dvData(properties, allCollections):
+    return collectionsDict(properties, allCollections, NKeep=100)
+
+
+def moves(solution, current, props):
+    assigned = {int(propID): collectionID 
+                for collectionID, propIDs in solution.items() 
+                for propID in propIDs}
+    return sum(1 for propID in props if assigned.get(propID) != current.get(propID))
+
+
+@pytest.mark.parametrize('NKeep', [1, 2, 4, 100])
+def test_keep_mask_matches_collections_dict(properties, allCollections, dvData, NKeep):
+    expected = collectionsDict(properties, allCollections, NKeep=NKeep)
+    mask = keepMask(dvData, NKeep=NKeep)
+    assert set(dvData.index[mask]) == set(expected.index)
+
+
+@pytest.mark.parametrize('NMaxStreets', [1, 2, 10])
+def test_keep_mask_matches_king_of_the_street(properties, NMaxStreets):
+    expected = kingOfTheStreet(properties, NMaxStreets=NMaxStreets)
+    kingData = kingOfTheStreet(properties, NMaxStreets=10)
+    mask = keepMask(kingData, NMaxStreets=NMaxStreets)
+    assert set(kingData.index[mask]) == set(expected.index)
+
+
+@pytest.mark.parametrize('maxMoves', [0, 1, 2, 5])
+def test_limit_moves(allCollections, dvData, maxMoves):
+    newbie = dvData[dvData.collectionID == 7].nsmallest(3, 'yield_per_hour')
+    props = set(dvData.propertyID)
+    for current in [{}, {int(propID): 7 for propID in newbie.propertyID}]:
+        prob, modelVars = buildModel(dvData, allCollections)
+        unlimited = solveModel(prob, dvData, modelVars)
+        assert moves(unlimited['solution'], current, props) > maxMoves
+        limitMoves(prob, dvData, modelVars, current, maxMoves)
+        result = solveModel(prob, dvData, modelVars)
+        assert result['status'] == 'Optimal'
+        assert moves(result['solution'], current, props) <= maxMoves
+        # Removing the cap restores the unconstrained optimum
+        limitMoves(prob, dvData, modelVars, current, None)
+        assert solveModel(prob, dvData, modelVars)['objective'] == pytest.approx(
+                                                            unlimited['objective'])
+
+
+def test_move_penalty_requires_current(allCollections, dvData):
+    prob, modelVars = buildModel(dvData, allCollections)
+    with pytest.raises(ValueError):
+        setObjective(prob, dvData, modelVars, movePenalty=1)
+
+
+def test_require_collections(allCollections, dvData):
+    prob, modelVars = buildModel(dvData, allCollections)
+    requireCollections(prob, dvData, modelVars, allCollections, [7])
+    result = solveModel(prob, dvData, modelVars)
+    assert result['status'] == 'Optimal'
+    assert len(result['solution'][7]) == 3
+
+    tooMany = allCollections.copy()
+    tooMany.loc[tooMany.id == 7, 'amount'] = 100
+    requireCollections(prob, dvData, modelVars, tooMany, [7])
+    result = solveModel(prob, dvData, modelVars)
+    assert result['status'] == 'Infeasible'
+    assert result['solution'] == {}
+
+
+def test_sweep_matches_fresh_models(properties, allCollections, dvData):
+    points = [{'NKeep': 1}, {'NKeep': 2}, {'NKeep': 4}]
+    prob, modelVars = buildModel(dvData, allCollections)
+    results = sweep(prob, dvData, modelVars, points, workers=2)
+    for point, result in zip(points, results):
+        fresh = collectionsDict(properties, allCollections, **point)
+        freshProb, freshVars = buildModel(fresh, allCollections)
+        expected = solveModel(freshProb, fresh, freshVars)
+        assert result['NKeep'] == point['NKeep']
+        assert result['status'] == expected['status'] == 'Optimal'
+        assert result['objective'] == pytest.approx(expected['objective'])
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from output import RECORD_SCHEMAS, SolutionSink, solution_records
+
+
+def solution(mint=250000.0, active=None, **scalars):
+    prop = {'id': '5', 'mint': mint}
+    if active is not None:
+        prop['active'] = active
+    return {'ILPSolution': {7: ['5'], 21: []},
+            'earnings': {'base_earnings': scalars.get('base', 10.0),
+                         'collection_earnings': float('nan'),
+                         'total_earnings': 12.0,
+                        },
+            'collections': {scalars.get('collectionID', 7): 
+                                {'name': 'Newbie', 
+                                 'properties': {'1 Main St': prop}}},
+           }
+
+
+def readLines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_user_record_counts_only_filled_collections():
+    record, = solution_records('bob', solution(), 'user')
+    assert record['active_collections'] == 1
+
+
+def test_nan_written_as_null(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    with SolutionSink(path, level='assignment') as sink:
+        sink.write('bob', solution(mint=float('nan')))
+    with SolutionSink(path, level='user', append=True) as sink:
+        sink.write('bob', solution())
+    assignment, user = readLines(path)
+    assert assignment['mint'] is None
+    assert user['collection_earnings'] is None
+
+
+def test_numpy_scalars_converted():
+    np = pytest.importorskip('numpy')
+    record, = solution_records('bob', solution(mint=np.float64('nan'), 
+                                               active=np.bool_(True),
+                                               collectionID=np.int32(7)), 
+                               'assignment')
+    assert record['mint'] is None
+    assert record['active'] is True
+    assert type(record['collection_id']) is int
+    user, = solution_records('bob', solution(base=np.float64(3.5)), 'user')
+    assert type(user['base_earnings']) is float
+
+
+def test_jsonl_overwrite_and_append(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    for _ in range(2):
+        with SolutionSink(path) as sink:
+            sink.write('bob', solution())
+    assert len(readLines(path)) == 1
+    with SolutionSink(path, append=True) as sink:
+        sink.write('alice', solution())
+    assert [r['username'] for r in readLines(path)] == ['bob', 'alice']
+
+
+def test_parquet_rejects_append(tmp_path):
+    with pytest.raises(ValueError):
+        SolutionSink(tmp_path / 'out.parquet', fmt='parquet', append=True)
+
+
+def test_parquet_schema_with_null_active(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = tmp_path / 'out.parquet'
+    with SolutionSink(path, fmt='parquet', level='assignment') as sink:
+        sink.write('bob', solution(mint=250000))
+        sink.write('alice', solution(mint=float('nan'), active=True))
+    table = pq.read_table(path)
+    assert table.schema.names == [name for name, _ in RECORD_SCHEMAS['assignment']]
+    assert str(table.schema.field('active').type) == 'bool'
+    assert table.column('active').to_pylist() == [None, True]
+    assert table.column('mint').to_pylist() == [250000.0, None]
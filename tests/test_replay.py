@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from replay import configure, fetchJSON, fixturePath, makeServer
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    # Undo any UPOPT_* settings a test or configure() makes
+    for name in ['UPOPT_MODE', 'UPOPT_FIXTURES', 'UPOPT_UPLAND_API', 
+                 'UPOPT_UPX_API']:
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    os.makedirs(tmp_path / 'fixtures' / 'upx' / 'upland')
+    with open(tmp_path / 'fixtures' / 'upx' / 'upland' / 'a b.json', 'w') as f:
+        json.dump({'data': {'properties': []}}, f)
+    with open(tmp_path / 'secret.json', 'w') as f:
+        json.dump({'secret': True}, f)
+    return str(tmp_path / 'fixtures')
+
+
+@pytest.fixture
+def server(fixtures):
+    def start(**kwargs):
+        server = makeServer(fixtures, port=0, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+@pytest.mark.parametrize('route', ['/../../secret', '/upland/../../../secret'])
+def test_fixture_path_rejects_escape(fixtures, route):
+    with pytest.raises(ValueError):
+        fixturePath('upx', route, fixtures)
+
+
+def test_fixture_path_rejects_unknown_api(fixtures):
+    with pytest.raises(ValueError):
+        fixturePath('..', '/secret', fixtures)
+
+
+def test_replay_mode(fixtures, monkeypatch):
+    monkeypatch.setenv('UPOPT_MODE', 'replay')
+    monkeypatch.setenv('UPOPT_FIXTURES', fixtures)
+    assert fetchJSON('upx', '/upland/a b') == {'data': {'properties': []}}
+    with pytest.raises(FileNotFoundError):
+        fetchJSON('upx', '/upland/missing')
+
+
+def test_configure(fixtures):
+    configure(mode='replay', fixtures=fixtures)
+    assert fetchJSON('upx', '/upland/a b') == {'data': {'properties': []}}
+    with pytest.raises(ValueError):
+        configure(mode='replya')
+
+
+def test_unknown_mode_is_rejected(monkeypatch):
+    monkeypatch.setenv('UPOPT_MODE', 'replya')
+    with pytest.raises(ValueError):
+        fetchJSON('upland', '/collections')
+
+
+def test_fetch_retries_then_raises(server, monkeypatch):
+    requests = pytest.importorskip('requests')
+    monkeypatch.setenv('UPOPT_UPX_API', server(errorRate=1.0) + '/upx')
+    calls = []
+    get = requests.get
+
+    def countingGet(*args, **kwargs):
+        calls.append(args)
+        return get(*args, **kwargs)
+
+    monkeypatch.setattr(requests, 'get', countingGet)
+    with pytest.raises(requests.HTTPError):
+        fetchJSON('upx', '/upland/a b', retries=2, backoff=0)
+    assert len(calls) == 3
+
+
+def test_record_mode(server, monkeypatch, tmp_path):
+    pytest.importorskip('requests')
+    recorded = str(tmp_path / 'recorded')
+    monkeypatch.setenv('UPOPT_MODE', 'record')
+    monkeypatch.setenv('UPOPT_FIXTURES', recorded)
+    monkeypatch.setenv('UPOPT_UPX_API', server() + '/upx')
+    data = fetchJSON('upx', '/upland/a b')
+    assert data == {'data': {'properties': []}}
+    path = fixturePath('upx', '/upland/a b', recorded)
+    with open(path) as f:
+        assert json.load(f) == data
+    assert os.listdir(os.path.dirname(path)) == ['a b.json']
+
+
+def test_server_decodes_path(server):
+    url = server()
+    assert get(f'{url}/upx/upland/a%20b') == {'data': {'properties': []}}
+
+
+@pytest.mark.parametrize('path', ['/upx/%2E%2E/%2E%2E/secret', '/upx/../../secret'])
+def test_server_rejects_escape(server, path):
+    url = server()
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(url + path)
+    assert error.value.code == 404
+
+
+def test_server_injects_errors(server):
+    url = server(errorRate=1.0)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(f'{url}/upx/upland/a%20b')
+    assert error.value.code == 503
@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
-import requests
-import sys
+from replay import fetchJSON
 
 def getCollections():
     '''
@@ -16,8 +15,7 @@ def getCollections():
     allCollections: DataFrame
         DataFrame of all collections
     '''    
-    response = requests.get(f'https://api.upland.me/collections')
-    allCollections = pd.DataFrame(response.json())
+    allCollections = pd.DataFrame(fetchJSON('upland', '/collections'))
     allCollections.sort_values('yield_boost', ascending=False, inplace=True)
     allCollections.reset_index(inplace=True)
     return allCollections
@@ -37,8 +35,7 @@ def getUserProperty(username):
 	properties: DataFrame
 	    Dataframe of all user properties
 	'''
-    response = requests.get(f'https://api.upx.world/upland/{username}' )
-    propsDict = response.json()['data']['properties'] 	
+    propsDict = fetchJSON('upx', f'/upland/{username}')['data']['properties'] 	
     properties = pd.DataFrame(propsDict) 
     properties = properties.replace('Unknown', np.NaN)
     properties['_id'] = pd.to_numeric( properties['_id'])
@@ -81,6 +78,66 @@ def defineDV(yield_per_hour,collectionID, yieldBoost, propID,
              }
      
                                          
+def trimDecisionVariables(dvData, NKeep=None, NMaxStreets=None, 
+                          NPropertiesMax=None):
+    '''
+    Finds the decision variables kept by the size limits of 
+    collectionsDict and kingOfTheStreet. Within each limit the highest
+    yield_per_hour rows are kept, ties going to the earlier row.
+    
+    Parameters
+    ----------
+    dvData: DataFrame
+        Decision Variables
+    NKeep: int
+        optional. Keep NKeep Newbie (7), NKeep+30 SFian (11) and NKeep 
+        City Pro (21) per city, NKeep+60 in city 1
+    NMaxStreets: int
+        optional. Keep the NMaxStreets King of the Street (1) streets 
+        with the largest total yield in each city
+    NPropertiesMax: int
+        optional. Keep NPropertiesMax King of the Street properties per 
+        street, applied before NMaxStreets
+    
+    Returns
+    -------
+    keep: Index
+        dvData index of the rows to keep
+    '''
+    yields = pd.to_numeric(dvData.yield_per_hour)
+    drop = []
+
+    def dropBeyond(rows, N):
+        ranked = yields[rows].sort_values(ascending=False, kind='stable')
+        drop.extend(ranked.index[N:])
+
+    if NKeep is not None:
+        dropBeyond(dvData.collectionID == 7, NKeep)
+        dropBeyond(dvData.collectionID == 11, NKeep+30)
+        for cityID in dvData.cityID.unique():
+            cityPro = (dvData.collectionID == 21) & (dvData.cityID == cityID)
+            dropBeyond(cityPro, NKeep+60 if cityID == 1 else NKeep)
+
+    king = dvData.collectionID == 1
+    if NPropertiesMax is not None:
+        for streetID in dvData[king].streetID.unique():
+            dropBeyond(king & (dvData.streetID == streetID), NPropertiesMax)
+
+    if NMaxStreets is not None:
+        kingData = dvData[king & ~dvData.index.isin(drop)]
+        for cityID in kingData.cityID.unique():
+            cityData = kingData[kingData.cityID == cityID]
+            # Compares properties, not streets, to NMaxStreets as before
+            if len(cityData) > NMaxStreets:
+                streetYield = yields[cityData.index].groupby(
+                                        cityData.streetID, sort=False).sum()
+                ranked = streetYield.sort_values(ascending=False, kind='stable')
+                removeStreets = ranked.index[NMaxStreets:]
+                drop.extend(cityData[cityData.streetID.isin(removeStreets)].index)
+
+    return dvData.index[~dvData.index.isin(drop)]
+
+
 def kingOfTheStreet(properties, NMaxStreets=2, NPropertiesMax=4):
     '''
     Creates kingOfTheStreet decsion variables
@@ -130,29 +187,10 @@ def kingOfTheStreet(properties, NMaxStreets=2, NPropertiesMax=4):
     kingData['cityID']=kingData.astype({'cityID':'int32'}).cityID 
     kingData['streetID']=kingData.astype({'streetID':'int32'}).streetID     
     
-    # Only keep N streets in each city with largest return
-    for streetID in kingData.streetID.unique():
-        streetData = kingData[kingData['streetID'] == streetID].copy(deep=True)       
-        if len(streetData) > NPropertiesMax:
-            streetData.sort_values('yield_per_hour', ascending=False, inplace=True) 
-            rmID =  streetData.index[-(len(streetData)-NPropertiesMax):]
-            kingData.drop(index=rmID, inplace=True)
-    
-    # maxStreets per city 
-    for cityID in kingData.cityID.unique():
-        cityData = kingData[kingData['cityID'] == cityID].copy(deep=True)        
-        
-        if len(cityData) > NMaxStreets:
-            streetYield={}
-            for streetID in cityData.streetID.unique():
-                streetYield[streetID] = cityData[cityData['streetID'] == streetID].yield_per_hour.sum()
-            sumStreetYield = pd.DataFrame([streetYield]).T    
-            sortedStreetYield = sumStreetYield[0].sort_values(ascending=False)
-           
-            removeStreets = sortedStreetYield[NMaxStreets:]
-            for streetID in removeStreets.index:
-                rmID =  cityData[cityData['streetID']==streetID].index
-                kingData.drop(index=rmID, inplace=True)
+    # Only keep NPropertiesMax per street and NMaxStreets per city
+    keep = trimDecisionVariables(kingData, NMaxStreets=NMaxStreets, 
+                                 NPropertiesMax=NPropertiesMax)
+    kingData = kingData.loc[keep]
     #import ipdb; ipdb.set_trace()
     return kingData
 
@@ -264,46 +302,17 @@ def collectionsDict(properties, allCollections, NKeep=30):
             rmID = dvData[dvData['collectionID']==collectionID].index
             dvData.drop(index=rmID, inplace=True) 
     
-    #Only keep Top NKeep Newbie 
-    NNewbie = (dvData.collectionID == 7).sum()    
-    if NNewbie > NKeep:
-       dvData['yield_per_hour']=pd.to_numeric( dvData.yield_per_hour)
-       rmId =  dvData[dvData.collectionID==7].nsmallest(
-                      columns='yield_per_hour', n=NNewbie-NKeep).index
-       dvData.drop(index=rmId, inplace=True)
-
-    #Only keep Top NKeep SFian 
-    NSFian = (dvData.collectionID == 11).sum()    
-    if NSFian > (NKeep+30):
-       dvData['yield_per_hour']=pd.to_numeric( dvData.yield_per_hour)
-       rmId =  dvData[dvData.collectionID==11].nsmallest(
-                      columns='yield_per_hour', n=NSFian-(NKeep+30)).index
-       dvData.drop(index=rmId, inplace=True)       
-       
-    # Only top NKeep per city in City Pro
+    # Remove City Pro in cities without enough properties
     for cityID in dvData.cityID.unique():
-        cityProps = dvData[dvData['cityID']==cityID].copy(deep=True)
-        cityProProps = cityProps[cityProps['collectionID']==21].copy(deep=True)
+        cityProProps = dvData[(dvData['cityID']==cityID) & (dvData['collectionID']==21)]
         NCityPro  = len(cityProProps)
         NNeeded = allCollections[allCollections['id']==21].amount.values
-        #import ipdb; ipdb.set_trace()
         if NCityPro < NNeeded:
             print(f'Not Enough Properties for City Pro CItyID: {cityID}')
-            rmID = cityProProps.index
-            dvData.drop(index=rmID, inplace=True) 
-        
-        if (NCityPro > NKeep) and (cityID != 1):
-           cityProProps.sort_values('yield_per_hour', ascending=False, inplace=True)          
-           rmID =  cityProProps.index[-(NCityPro-NKeep):]
-           #import ipdb; ipdb.set_trace()           
-           dvData.drop(index=rmID, inplace=True)  
-        elif (NCityPro > (NKeep+60)) and (cityID == 1):
-           cityProProps.sort_values('yield_per_hour', ascending=False, inplace=True)          
-           rmID =  cityProProps.index[-(NCityPro-(NKeep+60)):]
-           #import ipdb; ipdb.set_trace()           
-           dvData.drop(index=rmID, inplace=True)             
-                      
-           del cityProProps
+            dvData.drop(index=cityProProps.index, inplace=True) 
+
+    # Only keep Top NKeep Newbie, SFian and City Pro
+    dvData = dvData.loc[trimDecisionVariables(dvData, NKeep=NKeep)]
     return dvData
 
 
@@ -322,8 +331,6 @@ def write_solution(username, solution):
     None: 
         Writes f'{username.txt}' to file
     ''' 
-    allCollections = getCollections()    
-
     monthlyBaseEarnings = solution['earnings']['base_earnings']
     monthlyBoostEarnings = solution['earnings']['collection_earnings']
     monthlyUPX = solution['earnings']['total_earnings']    
@@ -361,7 +368,53 @@ def write_solution(username, solution):
                     f.write(f'{i+1}. {address}  [{status}]  (Mint: {mintPrice/1000} k )\n')               
                 i+=1
             f.write('\n')       
-        original_stdout = sys.stdout   
+
+
+def owns_solution(user_properties, optimized):
+    '''
+    Checks whether the optimized user is the owner of the auth key, i.e.
+    whether any property in the solution is one of the key owner's 
+    properties
+    
+    Parameters
+    ----------
+    user_properties: DataFrame
+        Key owner's properties, see get_user_properties_data
+    optimized: dictionary
+        solution dictionary
+    
+    Returns
+    -------
+    owns: bool
+        True if the solution shares a property with user_properties
+    '''
+    propIDs = {int(propID) for props in optimized['ILPSolution'].values() 
+               for propID in props}
+    return bool(propIDs & set(user_properties.prop_id.astype('int64')))
+
+
+def apply_active_collections(user_properties, optimized):
+    '''
+    Marks active collections when the optimized user owns the auth key, 
+    otherwise leaves 'active' unknown. Shared by the optimize and batch
+    commands so both produce the same records.
+    
+    Parameters
+    ----------
+    user_properties: DataFrame
+        Key owner's properties, see get_user_properties_data
+    optimized: dictionary
+        solution dictionary
+    
+    Returns
+    -------
+    optimized: dictionary
+        solution, with 'active' keys if the user owns the key
+    '''
+    if owns_solution(user_properties, optimized):
+        optimized = check_active_colletions(user_properties, optimized)
+    return optimized
+
 
 def check_active_colletions(user_properties, optimized):
     '''
@@ -375,9 +428,12 @@ def check_active_colletions(user_properties, optimized):
     -------
     optimized: dictionary
         returns optimized solution with new boolean 'active' key added 
-        to each property
+        to each property, False unless it matches an active collection
     '''
     allCollections = getCollections()
+    for collection in optimized['collections'].values():
+        for prop in collection['properties'].values():
+            prop['active'] = False
     active = user_properties[user_properties.collection_boost !=1].copy(deep=True)
     for collectionID, props in optimized['ILPSolution'].items():
         for propID in props:
@@ -413,8 +469,6 @@ def get_user_properties_data(auth):
     user_properties: DataFrame
         Dataframe of current active collections    
     '''
-    url = "https://api.upland.me/yield/mine"
     header = {"Authorization":auth}
-    response = requests.get(url, headers=header)
-    user_properties = pd.DataFrame(response.json())
+    user_properties = pd.DataFrame(fetchJSON('upland', '/yield/mine', header))
     return user_properties    
\ No newline at end of file